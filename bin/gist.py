@@ -10,6 +10,8 @@ import sys
 import json
 import socket
 import getpass
+from datetime import datetime
+from StringIO import StringIO
 
 # Try importing the library during development.
 try:
@@ -20,7 +22,7 @@ except ImportError:
     sys.path.insert(0, os.path.dirname(os.path.dirname(PATH)))
 
 # Should work, if the library is already installed.
-from gister import (authorizations, gists)
+from gister import (archive, authorizations, gists, stream, sync, watch)
 
 
 # Default path to store credentials locally.
@@ -160,7 +162,8 @@ def login(path=DEAFULT_CREDENTIALS_PATH, api=None, default=False):
     return False
 
 
-def upload(payload, token, description=None, public=False, update=False):
+def upload(payload, token, description=None, public=False, update=False,
+           name='stdin.txt'):
     '''
     Upload the payload to GitHub.
 
@@ -169,5 +172,110 @@ def upload(payload, token, description=None, public=False, update=False):
         2. If no description is provided, a default string with the
            login username, hostname, IP adderss and time (in UTC) will
            be provided.
+        3. The payload can be a string or a file-like object (e.g.:
+           sys.stdin), which is streamed in parts without reading it
+           entirely into memory.
+        4. To append to an existing Gist, pass its ID (a string) as
+           'update'; the new parts are numbered after the existing ones.
+        5. Returns the ID of the Gist, or None on failure.
     '''
-    pass
+    if update is not False and not isinstance(update, basestring):
+        raise ValueError('update: expected the ID of the Gist to append to')
+
+    if description is None:
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        description = ('Created using gist-shell from {host} ({addr}) by '
+                       '{user} at {time} UTC.').format(
+                           host=socket.getfqdn(), addr=get_external_ip_addr(),
+                           user=getpass.getuser(), time=now)
+
+    if isinstance(payload, unicode):
+        payload = payload.encode('utf-8')
+    if not hasattr(payload, 'read'):
+        payload = StringIO(payload)
+
+    gist_id = update if update else None
+    return stream.post_gist_stream(token, payload, name=name,
+                                   description=description, public=public,
+                                   gist_id=gist_id)
+
+
+def sync_dir(path, gist_id, token, dry_run=False):
+    '''
+    Synchronize a directory with a Gist (gist sync <dir> <gist_id>).
+
+    Caveats:
+        1. Only the top-level files are synchronized, Gists are flat.
+        2. Files on the Gist which don't exist in the directory are deleted.
+        3. Returns False if the Gist can't be fetched or updated.
+    '''
+    changes = sync.sync_gist(token, path, gist_id, dry_run=dry_run)
+    if changes is None:
+        return False
+
+    for name in changes['uploaded']:
+        print '+ {0}'.format(name)
+    for name in changes['deleted']:
+        print '- {0}'.format(name)
+
+    return True
+
+
+def watch_gists(gist_ids, token, user=None, interval=60):
+    '''
+    Watch Gists for changes, printing the diffs (gist watch <gist_id>...).
+
+    Caveats:
+        1. Runs until interrupted, or until all the Gists are deleted.
+        2. Gists owned by 'user' are checked with a single listing call.
+    '''
+    try:
+        for event in watch.watch_gists(token, gist_ids, user=user,
+                                       interval=interval):
+            if event['deleted']:
+                print '{0}: deleted'.format(event['id'])
+                continue
+            for name, change in sorted(event['files'].items()):
+                print '{0}: {1} {2}'.format(event['id'], change['status'],
+                                            name)
+                sys.stdout.write(change['diff'])
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        return
+
+
+def archive_gists(path, token, gist_ids=None, fmt='tar', **kwargs):
+    '''
+    Download Gists into a single archive (gist archive <path> [gist_id...]).
+
+    Caveats:
+        1. If 'path' is '-', the archive is written to stdout ('zip' needs
+           a file, it can't be streamed; a ValueError is raised).
+        2. If no Gist IDs are passed, the Gists are listed; 'user',
+           'starred' and 'since' are passed to the listing.
+        3. The progress, and failures, are reported on stderr.
+        4. Returns False if the listing failed, the archive was aborted,
+           or any of the Gists couldn't be archived.
+    '''
+    def _progress(gist_id, error):
+        if error is None:
+            sys.stderr.write('archived: {0}\n'.format(gist_id))
+        else:
+            sys.stderr.write('failed: {0} ({1})\n'.format(gist_id, error))
+
+    if path == '-' and fmt == 'zip':
+        raise ValueError('zip archives can\'t be written to stdout')
+
+    output = sys.stdout if path == '-' else open(path, 'wb')
+    try:
+        report = archive.archive_gists(token, output, gist_ids, fmt=fmt,
+                                       progress=_progress, **kwargs)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if report['error'] is not None:
+        sys.stderr.write('error: {0}\n'.format(report['error']))
+        return False
+
+    return len(report['failed']) < 1
@@ -2,8 +2,16 @@
 
 '''
 Library for doing stuff for GitHub Gists.
-gists: CRUD operationsGists on GitHub.
+archive: Download many Gists into a single tar or zip.
 authorizations: Handle authorization and authentication stuff.
+cache: Cached (stale-while-revalidate) and offline reads.
+dedup: Avoid re-posting identical Gists.
+gists: CRUD operationsGists on GitHub.
+journal: A durable, write-ahead queue for write operations.
+stream: Stream (large) input into a Gist.
+sync: Synchronize a local directory with a Gist.
+watch: Watch Gists for changes.
 '''
 
-__all__ = ['authorizations', 'gists']
+__all__ = ['archive', 'authorizations', 'cache', 'dedup', 'gists', 'journal',
+           'stream', 'sync', 'watch']
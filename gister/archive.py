@@ -0,0 +1,219 @@
+#! /usr/bin/env python2.7
+
+'''
+Download many Gists, in parallel, into a single (streaming) tar or zip.
+The Gists are fetched by a pool of threads into a bounded queue, and
+written (as <gist-id>/<filename>) straight to the output as they arrive;
+no temporary directories are used.
+Common arguments to all functions:
+    1. token: The access token for the API.
+    2. api: API URL for the endpoint, other than GitHub.
+'''
+
+import time
+import tarfile
+import zipfile
+import threading
+from Queue import Queue
+from cStringIO import StringIO
+
+import requests
+from requests.packages.urllib3 import exceptions as urllib3_exceptions
+
+from gister import gists
+
+# Archive formats, and their tarfile (streaming) modes.
+FORMATS = {
+    'tar': 'w|',
+    'tgz': 'w|gz',
+    'zip': None,
+}
+
+# Errors while fetching (or writing) the files of a Gist.
+ARCHIVE_ERRORS = (KeyError, ValueError, IOError, tarfile.TarError,
+                  requests.exceptions.RequestException,
+                  urllib3_exceptions.HTTPError)
+
+
+def fetch_worker(token, pending, fetched, api=None):
+    '''
+    Fetch Gists (by their IDs from 'pending') into the 'fetched' queue,
+    as (gist_id, gist, error) tuples; stops on a None.
+    '''
+    while True:
+        gist_id = pending.get()
+        if gist_id is None:
+            return
+
+        try:
+            gist = gists.get_gist(token, gist_id, api=api)
+            if 'files' in gist:
+                fetched.put((gist_id, gist, None))
+            else:
+                fetched.put((gist_id, None, gist.get('message', 'not found')))
+        except (AttributeError, TypeError,
+                requests.exceptions.RequestException) as error:
+            fetched.put((gist_id, None, str(error)))
+
+
+def seekable(output):
+    '''
+    Whether a file-like object can seek (e.g.: not a pipe).
+    '''
+    try:
+        output.seek(output.tell())
+    except (AttributeError, IOError, OSError, ValueError):
+        return False
+    return True
+
+
+def open_file(item):
+    '''
+    Return a tuple of (size, file-like object, response) for a file of a
+    Gist; truncated files are streamed from their 'raw_url', and the
+    response (None otherwise) has to be closed after reading.
+    '''
+    if not item.get('truncated'):
+        content = item.get('content') or ''
+        if isinstance(content, unicode):
+            content = content.encode('utf-8')
+        return (len(content), StringIO(content), None)
+
+    response = requests.get(item['raw_url'], stream=True)
+    try:
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        response.close()
+        raise
+    response.raw.decode_content = True
+    return (int(item['size']), response.raw, response)
+
+
+def write_gist(output, fmt, gist):
+    '''
+    Write the files of a Gist to the archive, as <gist-id>/<filename>.
+    Returns a tuple of (error, corrupt); 'corrupt' is True if the error
+    happened in the middle of a (tar) member, which can't be recovered.
+    '''
+    for name, item in sorted(gist['files'].items()):
+        arcname = '/'.join([gist['id'], name])
+
+        response = None
+        try:
+            try:
+                size, reader, response = open_file(item)
+                if fmt == 'zip':
+                    content = reader.read()
+            except ARCHIVE_ERRORS as error:
+                return (str(error) or error.__class__.__name__, False)
+
+            try:
+                if fmt == 'zip':
+                    output.writestr(arcname, content)
+                    continue
+
+                info = tarfile.TarInfo(arcname)
+                info.size = size
+                info.mode = 0644
+                info.mtime = int(time.time())
+                output.addfile(info, reader)
+            except ARCHIVE_ERRORS as error:
+                return (str(error) or error.__class__.__name__,
+                        fmt != 'zip')
+        finally:
+            if response is not None:
+                response.close()
+
+    return (None, False)
+
+
+def archive_gists(token, output, gist_ids=None, **kwargs):
+    '''
+    Archive Gists into 'output' (a file-like object, e.g.: sys.stdout).
+    If 'gist_ids' is None, the Gists are listed with fetch_gist_list; 'user',
+    'starred', 'since' and 'page_limit' (all the pages by default) are
+    passed to it.
+    fmt: One of FORMATS ('tar' and 'tgz' can be written to a pipe, 'zip'
+         needs a seekable file; a ValueError is raised otherwise).
+    workers: Number of threads fetching the Gists.
+    progress: Called as progress(gist_id, error) after every Gist; 'error'
+              is None if the Gist was archived.
+
+    Caveats:
+        1. At most 2 * 'workers' fetched Gists are held in memory at a time;
+           truncated (large) files are streamed into 'tar' and 'tgz'
+           archives, but are read entirely into memory (one at a time) for
+           'zip' archives, as zipfile can't write a member in chunks.
+        2. If a file fails in the middle of a tar member, the archive is
+           unusable; nothing more is written to it, and the remaining Gists
+           are reported as failed.
+        3. Returns a dictionary with the 'archived' Gists, the 'failed'
+           ones ({gist_id: error}) and an 'error' (None, unless the listing
+           failed or the archive was aborted).
+    '''
+    api = kwargs['api'] if 'api' in kwargs else None
+    fmt = kwargs['fmt'] if 'fmt' in kwargs else 'tar'
+    workers = kwargs['workers'] if 'workers' in kwargs else 8
+    progress = kwargs['progress'] if 'progress' in kwargs else None
+
+    if fmt not in FORMATS:
+        raise ValueError('Unknown archive format: {0}'.format(fmt))
+    if fmt == 'zip' and not seekable(output):
+        raise ValueError('A zip archive needs a seekable output')
+
+    report = {'archived': [], 'failed': {}, 'error': None}
+
+    if gist_ids is None:
+        query = dict([(_, kwargs[_]) for _ in ('starred', 'since')
+                      if _ in kwargs])
+        page_limit = kwargs['page_limit'] if 'page_limit' in kwargs else None
+        status, listing = gists.fetch_gist_list(
+            token, kwargs.get('user'), fields=['id'], page_limit=page_limit,
+            api=api, **query)
+        if listing is None:
+            report['error'] = 'listing failed (HTTP {0})'.format(status)
+            return report
+        gist_ids = [_.id for _ in listing]
+
+    workers = max(1, min(workers, len(gist_ids)))
+    pending, fetched = Queue(), Queue(maxsize=2 * workers)
+    for gist_id in gist_ids:
+        pending.put(gist_id)
+    for _ in range(workers):
+        pending.put(None)
+
+    threads = [threading.Thread(target=fetch_worker,
+                                args=(token, pending, fetched, api))
+               for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    if fmt == 'zip':
+        writer = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+    else:
+        writer = tarfile.open(fileobj=output, mode=FORMATS[fmt])
+
+    try:
+        for _ in range(len(gist_ids)):
+            gist_id, gist, error = fetched.get()
+            if report['error'] is not None:
+                # Keep draining, so that the workers finish.
+                error = 'archive aborted'
+            elif gist is not None:
+                error, corrupt = write_gist(writer, fmt, gist)
+                if corrupt:
+                    report['error'] = 'archive aborted at {0}: {1}'.format(
+                        gist_id, error)
+
+            if error is None:
+                report['archived'].append(gist_id)
+            else:
+                report['failed'][gist_id] = error
+
+            if progress is not None:
+                progress(gist_id, error)
+    finally:
+        writer.close()
+
+    return report
@@ -0,0 +1,256 @@
+#! /usr/bin/env python2.7
+
+'''
+Cached (stale-while-revalidate) reads of Gists and Gist listings.
+Every read returns a tuple of (data, meta); 'data' is None when nothing is
+available (as opposed to an empty Gist or listing) and 'meta' describes
+where it came from:
+    meta = {
+        'source': 'network' or 'cache',
+        'stale': True if the data may be out-of-date,
+        'age': Seconds since the data was fetched (0 if from the network),
+        'status': HTTP status of the response (None if from the cache).
+    }
+A '404 Not Found' is authoritative: the cached copy is evicted, and the
+read returns None (with the status), instead of the stale copy.
+Read policies:
+    1. 'online': Fetch from the network, fall back to the cache on failure.
+    2. 'stale': Serve the cached copy right away and refresh it in the
+       background once it is older than 'max_age' seconds.
+    3. 'offline': Only serve the cached copy, never touch the network.
+'''
+
+import os
+import json
+import threading
+from time import time
+from hashlib import sha1
+
+import requests
+
+from gister import gists
+
+# Default path to store the cached responses.
+DEFAULT_CACHE_PATH = '/'.join([os.path.expanduser('~'),
+                               '.gist-shell', 'cache'])
+
+# Read policies.
+POLICIES = ('online', 'stale', 'offline')
+
+# Background refreshes in flight, by key.
+REFRESHES = {}
+REFRESH_LOCK = threading.Lock()
+
+
+def cache_key(*args):
+    '''
+    Compute the cache key for a request.
+    '''
+    return sha1(json.dumps(args, sort_keys=True)).hexdigest()
+
+
+def api_token_key(token):
+    '''
+    Identify the token in a cache key, without storing the token itself.
+    '''
+    return sha1(token).hexdigest() if token is not None else None
+
+
+def load_entry(key, path=DEFAULT_CACHE_PATH):
+    '''
+    Load an entry ({'fetched_at': ..., 'etag': ..., 'data': ...}) from the
+    cache; returns None if it doesn't exist.
+    '''
+    entry = os.path.join(path, '{0}.json'.format(key))
+    if os.path.exists(entry):
+        try:
+            return json.loads(open(entry, 'r').read())
+        except (IOError, ValueError):
+            return None
+    return None
+
+
+def store_entry(key, data, etag=None, path=DEFAULT_CACHE_PATH):
+    '''
+    Store an entry in the cache (atomically); returns False on failure.
+    '''
+    entry = {'fetched_at': time(), 'etag': etag, 'data': data}
+    try:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        temp = os.path.join(path, '.{0}.{1}.json'.format(
+            key, threading.current_thread().ident))
+        with open(temp, 'w') as _entry_file:
+            _entry_file.write(json.dumps(entry))
+        os.rename(temp, os.path.join(path, '{0}.json'.format(key)))
+    except (IOError, OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+def evict_entry(key, path=DEFAULT_CACHE_PATH):
+    '''
+    Remove an entry from the cache; returns False if it doesn't exist.
+    '''
+    try:
+        os.remove(os.path.join(path, '{0}.json'.format(key)))
+    except OSError:
+        return False
+    return True
+
+
+def from_cache(entry, stale):
+    '''
+    Build the (data, meta) tuple for a cached entry.
+    '''
+    if entry is None:
+        return (None, {'source': 'cache', 'stale': True, 'age': None,
+                       'status': None})
+
+    age = max(0, time() - entry['fetched_at'])
+    return (entry['data'], {'source': 'cache', 'stale': stale, 'age': age,
+                            'status': None})
+
+
+def refresh(key, fetch, path=DEFAULT_CACHE_PATH, wait=True):
+    '''
+    Fetch the data with 'fetch' and update the cache. 'fetch' is called
+    with the cached entry and returns a tuple of (data, etag, status), or
+    None on failure; if 'data' is None (e.g.: a '404 Not Found'), the entry
+    is evicted. With 'wait' set to False, the refresh runs in a background
+    thread (at most one per key).
+    '''
+    def _refresh():
+        try:
+            fetched = fetch(load_entry(key, path=path))
+        except requests.exceptions.RequestException:
+            fetched = None
+
+        if fetched is not None and fetched[0] is None:
+            evict_entry(key, path=path)
+        elif fetched is not None:
+            store_entry(key, fetched[0], etag=fetched[1], path=path)
+        return fetched
+
+    def _background():
+        try:
+            _refresh()
+        finally:
+            with REFRESH_LOCK:
+                REFRESHES.pop(key, None)
+
+    if wait:
+        return _refresh()
+
+    with REFRESH_LOCK:
+        if key in REFRESHES:
+            return None
+        thread = threading.Thread(target=_background)
+        thread.daemon = True
+        REFRESHES[key] = thread
+
+    thread.start()
+    return None
+
+
+def wait_refreshes(timeout=None):
+    '''
+    Wait for the background refreshes to finish (e.g.: before exiting).
+    '''
+    with REFRESH_LOCK:
+        threads = list(REFRESHES.values())
+
+    for thread in threads:
+        thread.join(timeout)
+
+
+def cached_read(key, fetch, **kwargs):
+    '''
+    Read through the cache according to the read policy.
+    policy: One of POLICIES.
+    max_age: Seconds for which the cached copy is considered fresh.
+    path: Directory to cache the responses in.
+    '''
+    policy = kwargs['policy'] if 'policy' in kwargs else 'online'
+    max_age = kwargs['max_age'] if 'max_age' in kwargs else 60
+    path = kwargs['path'] if 'path' in kwargs else DEFAULT_CACHE_PATH
+
+    if policy not in POLICIES:
+        raise ValueError('Unknown read policy: {0}'.format(policy))
+
+    entry = load_entry(key, path=path)
+
+    if policy == 'offline':
+        return from_cache(entry, stale=True)
+
+    if policy == 'stale' and entry is not None:
+        if time() - entry['fetched_at'] <= max_age:
+            return from_cache(entry, stale=False)
+        refresh(key, fetch, path=path, wait=False)
+        return from_cache(entry, stale=True)
+
+    fetched = refresh(key, fetch, path=path)
+    if fetched is None:
+        return from_cache(entry, stale=True)
+
+    return (fetched[0], {'source': 'network', 'stale': False, 'age': 0,
+                         'status': fetched[2]})
+
+
+def get_gist(token, gist_id, revison=None, api=None, **kwargs):
+    '''
+    Same as gists.get_gist, but cached; see cached_read for the arguments.
+    The ETag of the cached copy is used to revalidate it, so an unchanged
+    Gist costs a '304 Not Modified'.
+    '''
+    key = cache_key('gist', api_token_key(token), api, gist_id, revison)
+
+    def _fetch(entry):
+        if revison is not None:
+            gist = gists.get_gist(token, gist_id, revison, api)
+            return (gist, None, 200) if 'id' in gist else None
+
+        etag = entry['etag'] if entry is not None else None
+        status, etag, gist = gists.fetch_gist(token, gist_id, etag=etag,
+                                              api=api)
+        if status == 304 and entry is not None:
+            return (entry['data'], etag, status)
+        if status == 404:
+            return (None, None, status)
+        return (gist, etag, status) if gist is not None else None
+
+    return cached_read(key, _fetch, **kwargs)
+
+
+def list_gist(token=None, user=None, **kwargs):
+    '''
+    Same as gists.list_gist, but cached; see cached_read for the arguments
+    ('policy', 'max_age' and 'path'), the rest are passed to gists.list_gist.
+
+    Caveats:
+        1. A failed listing (any page other than a '200 OK') is never
+           cached; the cached copy (if any) is served, marked as stale
+           (unless it is a '404 Not Found', e.g.: the user is gone).
+        2. Projected listings ('fields') are cached as dictionaries,
+           and rebuilt into GistRecord objects on read.
+    '''
+    options = dict([(_, kwargs.pop(_)) for _ in ('policy', 'max_age', 'path')
+                    if _ in kwargs])
+    fields = kwargs['fields'] if 'fields' in kwargs else None
+    key = cache_key('list', api_token_key(token), user, kwargs)
+
+    def _fetch(entry):
+        status, pages = gists.fetch_gist_list(token, user, **kwargs)
+        if status == 404:
+            return (None, None, status)
+        if pages is None:
+            return None
+        if fields is not None:
+            pages = [_.as_dict() for _ in pages]
+        return (pages, None, status)
+
+    data, meta = cached_read(key, _fetch, **options)
+    if data is not None and fields is not None:
+        data = [gists.GistRecord(**_) for _ in data]
+
+    return (data, meta)
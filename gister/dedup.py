@@ -0,0 +1,204 @@
+#! /usr/bin/env python2.7
+
+'''
+Avoid re-posting identical Gists.
+A local index maps a canonical hash of a Gist (the file names, the git blob
+hashes of their contents and the visibility) to the ID of the Gist; posting
+the same set of files again returns the existing Gist (after checking, with
+a single GET, that it still exists unchanged) without uploading it. The
+index is built from our own posts, and from (mirrored) listings, whose
+'raw_url's carry the blob hashes, so no contents need to be downloaded.
+Common arguments to all functions:
+    1. token: The access token for the API.
+    2. api: API URL for the endpoint, other than GitHub.
+'''
+
+import os
+import json
+import threading
+from hashlib import sha1
+
+from gister import gists, sync
+
+# Default path to store the index.
+DEFAULT_INDEX_PATH = '/'.join([os.path.expanduser('~'),
+                               '.gist-shell', 'dedup.json'])
+
+# Serializes the updates to the index.
+INDEX_LOCK = threading.Lock()
+
+
+def hash_content(content):
+    '''
+    Compute the git blob hash (SHA-1) of the contents of a file.
+    '''
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return sha1('blob {0}\0{1}'.format(len(content), content)).hexdigest()
+
+
+def canonical_hash(blobs, public=False):
+    '''
+    Compute the canonical hash of a Gist, from a dictionary of
+    {filename: blob-hash} and its visibility.
+    '''
+    canonical = json.dumps({'files': sorted(blobs.items()),
+                            'public': bool(public)}, sort_keys=True)
+    return sha1(canonical).hexdigest()
+
+
+def hash_files(files, public=False):
+    '''
+    Compute the canonical hash for the 'files' argument of post_gist
+    ({filename: {'content': ...}}) or post_gist_git ({filename: {'path':
+    ...}}). Returns None if the contents can't be read.
+    post_gist_git copies the files by path, so they are named after the
+    basename of the path, not the key.
+    '''
+    blobs = {}
+    try:
+        for name, item in files.items():
+            if 'content' in item:
+                blobs[name] = hash_content(item['content'])
+            else:
+                name = os.path.basename(item['path'])
+                blobs[name] = sync.hash_file(item['path'])
+    except (KeyError, TypeError, IOError, OSError):
+        return None
+    return canonical_hash(blobs, public)
+
+
+def hash_gist(gist):
+    '''
+    Compute the canonical hash of a Gist from its JSON (e.g.: a listing);
+    returns None if a blob hash is missing from a 'raw_url'.
+    '''
+    blobs = {}
+    for name, item in gist.get('files', {}).items():
+        blobs[name] = sync.parse_blob_hash(item.get('raw_url'))
+        if blobs[name] is None:
+            return None
+    return canonical_hash(blobs, gist.get('public'))
+
+
+def load_index(path=DEFAULT_INDEX_PATH):
+    '''
+    Load the index ({canonical-hash: gist-id}).
+    '''
+    if os.path.exists(path):
+        try:
+            return json.loads(open(path, 'r').read())
+        except (IOError, ValueError):
+            return {}
+    return {}
+
+
+def update_index(entries, remove=None, path=DEFAULT_INDEX_PATH):
+    '''
+    Add entries ({canonical-hash: gist-id}) to the index, and remove the
+    entries pointing to the Gists in 'remove'; returns False on failure.
+    '''
+    remove = set(remove) if remove is not None else set()
+    with INDEX_LOCK:
+        index = load_index(path=path)
+        index = dict([(_, gist_id) for _, gist_id in index.items()
+                      if gist_id not in remove])
+        index.update(entries)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            temp = '{0}.tmp'.format(path)
+            with open(temp, 'w') as _index_file:
+                _index_file.write(json.dumps(index, indent=4, sort_keys=True))
+            os.rename(temp, path)
+        except (IOError, OSError):
+            return False
+    return True
+
+
+def index_gists(listing, path=DEFAULT_INDEX_PATH):
+    '''
+    Add the Gists in a listing (the raw JSON from list_gist) to the index.
+    Returns the number of Gists indexed.
+    '''
+    entries = {}
+    for gist in listing:
+        hashed = hash_gist(gist) if isinstance(gist, dict) else None
+        if hashed is not None and 'id' in gist:
+            entries.setdefault(hashed, gist['id'])
+
+    if len(entries) > 0:
+        update_index(entries, path=path)
+    return len(entries)
+
+
+def forget(gist_ids, path=DEFAULT_INDEX_PATH):
+    '''
+    Remove (e.g.: deleted) Gists from the index.
+    '''
+    return update_index({}, remove=gist_ids, path=path)
+
+
+def lookup(token, hashed, api=None, path=DEFAULT_INDEX_PATH):
+    '''
+    Look up a canonical hash in the index, and fetch the Gist to make sure
+    it still exists, unchanged; returns the Gist (JSON) or None. Gists
+    which were deleted, or changed since, are removed from the index.
+    '''
+    gist_id = load_index(path=path).get(hashed)
+    if gist_id is None:
+        return None
+
+    status, _, gist = gists.fetch_gist(token, gist_id, api=api)
+    if status == 404 or (gist is not None and hash_gist(gist) != hashed):
+        forget([gist_id], path=path)
+        return None
+    return gist
+
+
+def post_gist(token, files, description=None, public=False, api=None,
+              **kwargs):
+    '''
+    Same as gists.post_gist, but if an identical Gist was posted (or
+    indexed) before, and is unchanged, returns it without posting.
+    dedup: Set to False to always post (the index is still updated).
+    path: Path to the index.
+    '''
+    dedup = kwargs['dedup'] if 'dedup' in kwargs else True
+    path = kwargs['path'] if 'path' in kwargs else DEFAULT_INDEX_PATH
+
+    hashed = hash_files(files, public)
+    if dedup and hashed is not None:
+        gist = lookup(token, hashed, api=api, path=path)
+        if gist is not None:
+            return gist
+
+    gist = gists.post_gist(token, files, description, public, api)
+    if hashed is not None and 'id' in gist:
+        update_index({hashed: gist['id']}, path=path)
+    return gist
+
+
+def post_gist_git(token, files, **kwargs):
+    '''
+    Same as gists.post_gist_git, but if an identical Gist was posted (or
+    indexed) before, and is unchanged, returns its ID without posting.
+    dedup: Set to False to always post (the index is still updated).
+    index_path: Path to the index.
+    '''
+    dedup = kwargs.pop('dedup') if 'dedup' in kwargs else True
+    path = kwargs.pop('index_path') if 'index_path' in kwargs \
+        else DEFAULT_INDEX_PATH
+    api = kwargs['api'] if 'api' in kwargs else None
+    public = kwargs['public'] if 'public' in kwargs else False
+
+    hashed = hash_files(files, public)
+    if dedup and hashed is not None:
+        gist = lookup(token, hashed, api=api, path=path)
+        if gist is not None:
+            return gist['id']
+
+    gist_id = gists.post_gist_git(token, files, **kwargs)
+    if hashed is not None and gist_id is not None:
+        update_index({hashed: gist_id}, path=path)
+    return gist_id
@@ -12,6 +12,7 @@ import re
 import json
 import shutil
 import fnmatch
+import tempfile
 import distutils.spawn
 from socket import getfqdn
 from getpass import getuser
@@ -30,6 +31,68 @@ GIST_HEADER = {
 }
 
 
+def intern_value(value, interned):
+    '''
+    Return a shared copy of a (frequently repeated) value from 'interned',
+    a dictionary scoped to a single listing.
+    The built-in 'intern' doesn't work with unicode objects.
+    '''
+    if value is None or interned is None:
+        return value
+    return interned.setdefault(value, value)
+
+
+class GistRecord(object):
+    '''
+    A compact (slotted) record of a Gist, for large listings.
+    Fields which weren't projected are set to None.
+    owner: The login of the owner.
+    files: A tuple of the file names.
+    languages: A tuple of the (distinct) languages of the files.
+    '''
+    __slots__ = ('id', 'description', 'public', 'owner', 'files',
+                 'languages', 'comments', 'created_at', 'updated_at',
+                 'html_url', 'git_pull_url', 'git_push_url', 'truncated')
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+    def __repr__(self):
+        return '<GistRecord {0} ({1})>'.format(self.id, self.owner)
+
+    def as_dict(self):
+        '''
+        Return the record as a dictionary.
+        '''
+        return dict([(_, getattr(self, _)) for _ in self.__slots__])
+
+
+def project_gist(gist, fields, interned=None):
+    '''
+    Project the JSON of a Gist (from a listing) into a GistRecord,
+    keeping only the (supported) fields in 'fields'.
+    interned: A dictionary (shared across a listing) used to intern the
+              low-cardinality values, i.e. owner logins and languages.
+    '''
+    record = {}
+    for field in fields:
+        if field == 'owner':
+            owner = gist.get('owner') or {}
+            record[field] = intern_value(owner.get('login'), interned)
+        elif field == 'files':
+            record[field] = tuple(sorted(gist.get('files', {}).keys()))
+        elif field == 'languages':
+            languages = set([_.get('language') for _ in
+                             gist.get('files', {}).values()])
+            record[field] = tuple([intern_value(_, interned) for _ in
+                                   sorted(languages) if _ is not None])
+        else:
+            record[field] = gist.get(field)
+
+    return GistRecord(**record)
+
+
 def parse_link_header(page, expression):
     '''
     Helper method for check_page_limit.
@@ -55,16 +118,22 @@ def check_page_limit(response):
         return parse_link_header(page, 'next')
 
 
-def list_gist(token=None, user=None, **kwargs):
+def fetch_gist_list(token=None, user=None, **kwargs):
     '''
     List Gists. If 'user' is specified, lists public gists for that user.
     If authenticated (by passing the access token), it returns the public
     Gists of that user.
+    Returns a tuple of (status, gists), so that a failure can be told apart
+    from an empty listing; on a failure, 'status' is that of the failed
+    page and 'gists' is None.
     per_page: Number of results per page.
-    page_limit: Fetch results upto this page.
+    page_limit: Fetch results upto this page (None to fetch all of them).
     since: Timestamp in ISO 8601 format: YYYY-MM-DDTHH:MM:SSZ.
     starred: Return starred Gists of the authenticated user.
              An empty list will both username and token is passed.
+    fields: Project each Gist into a compact GistRecord with only these
+            fields (e.g.: ['id', 'owner', 'files']), instead of returning
+            the raw JSON; unknown fields are ignored.
     '''
     pages = []
     api = kwargs['api'] if 'api' in kwargs else None
@@ -72,6 +141,11 @@ def list_gist(token=None, user=None, **kwargs):
     starred = kwargs['starred'] if 'starred' in kwargs else False
     per_page = kwargs['per_page'] if 'per_page' in kwargs else 100
     page_limit = kwargs['page_limit'] if 'page_limit' in kwargs else 2
+    fields = kwargs['fields'] if 'fields' in kwargs else None
+
+    if fields is not None:
+        fields = [_ for _ in fields if _ in GistRecord.__slots__]
+    interned = {}
 
     url = GITHUB_API_URL if api is None else api.rstrip('/')
     params = {'per_page': per_page, 'since': since} \
@@ -93,27 +167,42 @@ def list_gist(token=None, user=None, **kwargs):
         if token is not None and user is None:
             url = '/'.join([url, 'starred'])
         else:
-            return []
+            return (200, [])
 
     current = 1
 
-    while current <= page_limit:
+    while page_limit is None or current <= page_limit:
         params.update({'page': current})
         response = requests.get(url, headers=GIST_HEADER, params=params)
         if response.status_code == 200:
             try:
-                pages.extend(response.json())
-            except (KeyError, ValueError):
-                return []
+                if fields is None:
+                    pages.extend(response.json())
+                else:
+                    pages.extend([project_gist(_, fields, interned)
+                                  for _ in response.json()])
+            except (KeyError, ValueError, AttributeError):
+                return (response.status_code, None)
         else:
-            return []
+            return (response.status_code, None)
 
         limit = check_page_limit(response)
         if limit is None:
             break
         current += 1
 
-    return pages
+    return (200, pages)
+
+
+def list_gist(token=None, user=None, **kwargs):
+    '''
+    List Gists. If 'user' is specified, lists public gists for that user.
+    If authenticated (by passing the access token), it returns the public
+    Gists of that user. Returns an empty list on a failure; see
+    fetch_gist_list for the arguments.
+    '''
+    status, pages = fetch_gist_list(token, user, **kwargs)
+    return pages if pages is not None else []
 
 
 def get_gist(token, gist_id, revison=None, api=None):
@@ -140,6 +229,33 @@ def get_gist(token, gist_id, revison=None, api=None):
         return {}
 
 
+def fetch_gist(token, gist_id, etag=None, api=None):
+    '''
+    Conditionally fetch a Gist, using the 'ETag' from a previous response.
+    Returns a tuple of (status, etag, gist); on a '304 Not Modified' (which
+    does not count against the rate limit), the gist is None.
+    '''
+    url = GITHUB_API_URL if api is None else api.rstrip('/')
+
+    if token is not None:
+        GIST_HEADER.update({'Authorization': ' '.join(['token', token])})
+
+    headers = dict(GIST_HEADER)
+    if etag is not None:
+        headers.update({'If-None-Match': etag})
+
+    url = '/'.join([url, 'gists', str(gist_id)])
+    response = requests.get(url, headers=headers)
+
+    if response.status_code != 200:
+        return (response.status_code, etag, None)
+
+    try:
+        return (200, response.headers.get('ETag'), response.json())
+    except (KeyError, ValueError):
+        return (response.status_code, etag, None)
+
+
 def post_gist(token, files, description=None, public=False, api=None):
     '''
     Post a Gist.
@@ -192,16 +308,18 @@ def update_gist(token, gist_id, files, description, api=None):
         },
         'delete_this_file.txt': None
     }
+    If 'description' is None, the description is left unchanged.
     '''
     url = GITHUB_API_URL if api is None else api.rstrip('/')
 
     if token is not None:
         GIST_HEADER.update({'Authorization': ' '.join(['token', token])})
 
-    payload = json.dumps({
-        'description': description,
-        'files': files
-    })
+    payload = {'files': files}
+    if description is not None:
+        payload.update({'description': description})
+
+    payload = json.dumps(payload)
     url = '/'.join([url, 'gists', gist_id])
     response = requests.patch(url, data=payload, headers=GIST_HEADER)
     try:
@@ -255,6 +373,7 @@ def star_gist(token, gist_id, flag=None, api=None):
     '''
     Star (or un-star) a Gist on GitHub.
     flag: True - star, False - un-star, None - get 'star' status.
+    Returns True if the Gist is starred (or if (un-)starring it succeeded).
     '''
     url = GITHUB_API_URL if api is None else api.rstrip('/')
 
@@ -270,7 +389,8 @@ def star_gist(token, gist_id, flag=None, api=None):
         response = requests.delete(url, headers=GIST_HEADER)
     else:
         response = requests.get(url, headers=GIST_HEADER)
-        return True if response.status_code == 204 else False
+
+    return True if response.status_code == 204 else False
 
 
 def fork_gist(token, gist_id, api=None):
@@ -515,3 +635,127 @@ def get_gist_git(gist, pull_url, dest_dir_path, current_dir_path, files=None):
     shutil.rmtree(gist_dir_path)
 
     return copy_files
+
+
+def clone_gist_git(token, pull_url, api=None):
+    '''
+    Clone a Gist into a temporary directory, and configure the committer.
+    Returns the path to the clone, or None on failure.
+    '''
+    git = distutils.spawn.find_executable('git')
+    if git is None:
+        return None
+
+    addr = get_email_addr(token, api=api) if token is not None else None
+    if addr is not None:
+        email = ['user.email', addr]
+    else:
+        email = ['user.name', getuser()]
+
+    gist_dir_path = tempfile.mkdtemp(prefix='gist-shell-')
+    commands = [
+        [git, 'clone', pull_url, gist_dir_path],
+        [git, 'config', '--local'] + email
+    ]
+
+    for command in commands:
+        execute = Popen(command, stdout=PIPE, stderr=PIPE, close_fds=True,
+                        cwd=gist_dir_path)
+        execute.communicate()
+        if execute.returncode != 0:
+            shutil.rmtree(gist_dir_path, ignore_errors=True)
+            return None
+
+    return gist_dir_path
+
+
+def push_gist_git(token, gist_dir_path, push_url):
+    '''
+    Commit all the changes in a clone of a Gist, and push them.
+    '''
+    git = distutils.spawn.find_executable('git')
+    if git is None:
+        return False
+
+    protocol, uri = push_url.split('://')
+    commands = [
+        [git, 'add', '--all', '.'],
+        [git, 'commit', '-m', 'From gist-shell'],
+        [git, 'push', '{0}://{1}:@{2}'.format(protocol, token, uri)]
+    ]
+
+    for command in commands:
+        execute = Popen(command, stdout=PIPE, stderr=PIPE, close_fds=True,
+                        cwd=gist_dir_path)
+        execute.communicate()
+        if execute.returncode != 0:
+            return False
+
+    return True
+
+
+def update_gist_git(token, gist_id, files, **kwargs):
+    '''
+    Same as update_gist but for files which are not plain-text or truncated;
+    the changes are pushed to the Gist's git repository.
+    'files' should be a dictionary object, in the following format.
+    files = {
+        'large_file.bin': {
+            'path': '/path/to/large_file.bin'
+        },
+        'delete_this_file.txt': None
+    }
+    '''
+    api = kwargs['api'] if 'api' in kwargs else None
+    pull_url = kwargs['pull_url'] if 'pull_url' in kwargs else None
+    push_url = kwargs['push_url'] if 'push_url' in kwargs else None
+
+    if pull_url is None or push_url is None:
+        gist = get_gist(token, gist_id, api=api)
+        try:
+            pull_url, push_url = gist['git_pull_url'], gist['git_push_url']
+        except (KeyError, TypeError):
+            return False
+
+    gist_dir_path = clone_gist_git(token, pull_url, api=api)
+    if gist_dir_path is None:
+        return False
+
+    try:
+        for name, item in files.items():
+            target = os.path.join(gist_dir_path, os.path.basename(name))
+            if item is None:
+                if os.path.exists(target):
+                    os.remove(target)
+            else:
+                shutil.copyfile(item['path'], target)
+
+        return push_gist_git(token, gist_dir_path, push_url)
+
+    except (KeyError, TypeError, IOError, OSError):
+        return False
+
+    finally:
+        shutil.rmtree(gist_dir_path, ignore_errors=True)
+
+
+def get_rate_limit(token, api=None):
+    '''
+    Get the 'core' rate limit status ({'limit': ..., 'remaining': ...,
+    'reset': ...}); checking it doesn't count against the rate limit.
+    '''
+    url = GITHUB_API_URL if api is None else api.rstrip('/')
+
+    if token is not None:
+        GIST_HEADER.update({'Authorization': ' '.join(['token', token])})
+
+    url = '/'.join([url, 'rate_limit'])
+    response = requests.get(url, headers=GIST_HEADER)
+
+    if response.status_code != 200:
+        return {}
+
+    try:
+        return response.json()['resources']['core']
+    except (KeyError, ValueError):
+        return {}
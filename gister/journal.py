@@ -0,0 +1,421 @@
+#! /usr/bin/env python2.7
+
+'''
+A durable, write-ahead queue for write operations on Gists.
+Operations are appended (and fsync'ed) to a journal and return right away;
+a background flusher sends them to GitHub, coalescing consecutive updates
+to the same Gist into a single PATCH, retrying failures with a backoff and
+draining independent Gists in parallel. Pending operations survive a crash,
+and are replayed the next time the journal is opened.
+Journal records (one JSON object per line):
+    {'seq': 1, 'op': 'update', 'args': {...}}
+    {'seq': 1, 'sent': True}
+    {'seq': 1, 'done': True, 'result': ...}
+    {'seq': 1, 'failed': True}
+Operations are delivered at-least-once: an operation is sent again if the
+process crashes after sending it, but before recording it as done. Deletes,
+updates and (un-)stars are safe to repeat (a replayed delete or un-star of a
+Gist which is already gone counts as done). A post isn't, so it is marked as
+'sent' first; a post found 'sent' (but not done) on replay is marked as
+failed instead of being posted again (see Journal.retry_failed).
+'''
+
+import os
+import json
+import fcntl
+import threading
+from time import time
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from gister import gists
+
+# Default path to the journal.
+DEFAULT_JOURNAL_PATH = '/'.join([os.path.expanduser('~'),
+                                 '.gist-shell', 'journal.log'])
+
+# Supported operations, and their arguments.
+OPERATIONS = {
+    'post': ('files', 'description', 'public'),
+    'update': ('gist_id', 'files', 'description'),
+    'delete': ('gist_id',),
+    'star': ('gist_id', 'flag'),
+}
+
+
+def renames(op):
+    '''
+    Whether an operation renames any of the files of a Gist.
+    '''
+    files = op['args'].get('files') or {}
+    return any([isinstance(_, dict) and 'filename' in _
+                for _ in files.values()])
+
+
+def coalesce(ops):
+    '''
+    Merge consecutive updates (in a list of operations on the same Gist)
+    into one; returns a list of (operation, [merged sequence numbers]).
+    The changes to a file are merged (a None, i.e.: a delete, replaces
+    them); updates which rename a file are never merged.
+    '''
+    merged = []
+    for op in ops:
+        if op['op'] == 'update' and len(merged) > 0 and \
+                merged[-1][0]['op'] == 'update' and \
+                not renames(op) and not renames(merged[-1][0]):
+            last = merged[-1][0]
+            files = dict(last['args']['files'])
+            for name, item in op['args']['files'].items():
+                if files.get(name) is not None and item is not None:
+                    item = dict(files[name].items() + item.items())
+                files[name] = item
+            description = op['args']['description'] \
+                if op['args']['description'] is not None \
+                else last['args']['description']
+            args = dict(last['args'], files=files, description=description)
+            merged[-1] = (dict(last, args=args), merged[-1][1] + [op['seq']])
+        else:
+            merged.append((op, [op['seq']]))
+    return merged
+
+
+class Journal(object):
+    '''
+    A write-ahead queue of operations on Gists.
+    token: The access token for the API (never written to the journal).
+    path: Path to the journal.
+    workers: Number of Gists drained in parallel.
+    interval: Seconds to wait for more operations before flushing.
+    backoff: Initial delay (in seconds) before retrying a failure; doubled
+             after every attempt, up to 'max_backoff'.
+    max_attempts: Attempts before an operation is marked as failed (it is
+                  kept in the journal, see retry_failed).
+    compact_after: Rewrite the journal once nothing is pending, and at least
+                   these many operations are done.
+
+    Caveats:
+        1. A journal is used by a single Journal at a time; it is locked
+           (with '<path>.lock') until close, and an IOError is raised if it
+           is already locked.
+    '''
+
+    def __init__(self, token, path=DEFAULT_JOURNAL_PATH, **kwargs):
+        self.token = token
+        self.path = path
+        self.api = kwargs['api'] if 'api' in kwargs else None
+        self.workers = kwargs['workers'] if 'workers' in kwargs else 4
+        self.interval = kwargs['interval'] if 'interval' in kwargs else 1
+        self.backoff = kwargs['backoff'] if 'backoff' in kwargs else 2
+        self.max_backoff = kwargs['max_backoff'] if 'max_backoff' in kwargs \
+            else 300
+        self.max_attempts = kwargs['max_attempts'] \
+            if 'max_attempts' in kwargs else 8
+        self.compact_after = kwargs['compact_after'] \
+            if 'compact_after' in kwargs else 1000
+
+        self.seq = 0
+        self.pending = {}
+        self.failed = {}
+        self.results = {}
+        self.retries = {}
+        self.done = 0
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.flusher = None
+
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+
+        # The lock file outlives the journal's inode, which compact swaps.
+        self.locked = open('{0}.lock'.format(self.path), 'a')
+        try:
+            fcntl.flock(self.locked, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            self.locked.close()
+            raise IOError('Journal in use: {0}'.format(self.path))
+
+        self.replay()
+        self.journal = open(self.path, 'a')
+
+    def replay(self):
+        '''
+        Load the pending (and failed) operations from the journal.
+        A torn (partially written) last record is truncated, so that the
+        next record starts on a line of its own.
+        '''
+        if not os.path.exists(self.path):
+            return
+
+        sent, offset = set(), 0
+        with open(self.path, 'r') as _journal:
+            for line in _journal:
+                if not line.endswith('\n'):
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                    seq = record['seq']
+                except (KeyError, ValueError, TypeError):
+                    continue
+
+                self.seq = max(self.seq, seq)
+                if 'op' in record:
+                    self.pending[seq] = record
+                elif record.get('done'):
+                    self.pending.pop(seq, None)
+                    self.failed.pop(seq, None)
+                elif record.get('failed') and seq in self.pending:
+                    self.failed[seq] = self.pending.pop(seq)
+                elif record.get('sent'):
+                    sent.add(seq)
+
+        # The outcome of these posts is unknown; don't post them again.
+        for seq in sorted(sent & set(self.pending.keys())):
+            self.failed[seq] = self.pending.pop(seq)
+
+        if os.path.getsize(self.path) > offset:
+            with open(self.path, 'r+') as _journal:
+                _journal.truncate(offset)
+                _journal.flush()
+                os.fsync(_journal.fileno())
+
+    def append(self, record):
+        '''
+        Append a record to the journal, and wait for it to hit the disk.
+        '''
+        self.journal.write(json.dumps(record, sort_keys=True) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def enqueue(self, op, **args):
+        '''
+        Queue an operation (one of OPERATIONS); returns its sequence number
+        once it is in the journal. For example:
+            journal.enqueue('update', gist_id='aa5a315d61ae9438b18d',
+                            files={'file1.txt': {'content': 'foo'}})
+        '''
+        if op not in OPERATIONS:
+            raise ValueError('Unknown operation: {0}'.format(op))
+
+        args = dict([(_, args.get(_)) for _ in OPERATIONS[op]])
+        if op == 'post' and args['public'] is None:
+            args['public'] = False
+
+        with self.lock:
+            self.seq += 1
+            record = {'seq': self.seq, 'op': op, 'args': args}
+            self.append(record)
+            self.pending[self.seq] = record
+
+        self.wakeup.set()
+        return record['seq']
+
+    def post_gist(self, files, description=None, public=False):
+        '''
+        Queue gists.post_gist; see result for the ID of the new Gist.
+        '''
+        return self.enqueue('post', files=files, description=description,
+                            public=public)
+
+    def update_gist(self, gist_id, files, description=None):
+        '''
+        Queue gists.update_gist.
+        '''
+        return self.enqueue('update', gist_id=gist_id, files=files,
+                            description=description)
+
+    def delete_gist(self, gist_id):
+        '''
+        Queue gists.delete_gist.
+        '''
+        return self.enqueue('delete', gist_id=gist_id)
+
+    def star_gist(self, gist_id, flag=True):
+        '''
+        Queue gists.star_gist.
+        '''
+        return self.enqueue('star', gist_id=gist_id, flag=flag)
+
+    def result(self, seq):
+        '''
+        Result of a flushed operation (e.g.: the ID of a posted Gist),
+        or None if it hasn't been flushed (yet).
+        '''
+        return self.results.get(seq)
+
+    def execute(self, op):
+        '''
+        Send an operation to GitHub; returns a tuple of (status, result).
+        '''
+        args, token, api = op['args'], self.token, self.api
+        try:
+            if op['op'] == 'post':
+                gist = gists.post_gist(token, args['files'],
+                                       args['description'], args['public'],
+                                       api)
+                return ('id' in gist, gist.get('id'))
+            elif op['op'] == 'update':
+                gist = gists.update_gist(token, args['gist_id'],
+                                         args['files'], args['description'],
+                                         api=api)
+                return ('id' in gist, gist.get('id'))
+            elif op['op'] == 'delete':
+                if gists.delete_gist(token, args['gist_id'], api):
+                    return (True, None)
+                # Deleted already (e.g.: a replay), if it doesn't exist.
+                status, _, _ = gists.fetch_gist(token, args['gist_id'],
+                                                api=api)
+                return (status == 404, None)
+
+            if gists.star_gist(token, args['gist_id'], args['flag'], api):
+                return (True, None)
+            if args['flag'] is False:
+                # Un-starred already, if it isn't starred (or is gone).
+                return (not gists.star_gist(token, args['gist_id'], None,
+                                            api), None)
+            return (False, None)
+        except requests.exceptions.RequestException:
+            return (False, None)
+
+    def drain(self, ops):
+        '''
+        Send the (coalesced) operations on a single Gist, in order; stops at
+        the first failure so that the order is preserved.
+        '''
+        for op, merged in coalesce(ops):
+            if op['op'] == 'post':
+                with self.lock:
+                    self.append({'seq': op['seq'], 'sent': True})
+            status, result = self.execute(op)
+
+            with self.lock:
+                if status:
+                    for seq in merged:
+                        self.append({'seq': seq, 'done': True,
+                                     'result': result})
+                        self.pending.pop(seq, None)
+                        self.retries.pop(seq, None)
+                        self.results[seq] = result
+                        self.done += 1
+                    continue
+
+                attempts, _ = self.retries.get(op['seq'], (0, 0))
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    for seq in merged:
+                        self.append({'seq': seq, 'failed': True})
+                        self.failed[seq] = self.pending.pop(seq)
+                        self.retries.pop(seq, None)
+                else:
+                    delay = min(self.max_backoff,
+                                self.backoff * 2 ** (attempts - 1))
+                    self.retries[op['seq']] = (attempts, time() + delay)
+            return
+
+    def flush(self):
+        '''
+        Send the pending operations which are due; Gists are drained in
+        parallel. Returns the number of operations still pending.
+        '''
+        with self.flushing:
+            return self.flush_due()
+
+    def flush_due(self):
+        '''
+        Helper method for flush (called with the flush lock held).
+        '''
+        now = time()
+        groups = {}
+        with self.lock:
+            for seq in sorted(self.pending.keys()):
+                op = self.pending[seq]
+                key = op['args'].get('gist_id') or 'post-{0}'.format(seq)
+                groups.setdefault(key, []).append(op)
+
+        due = [ops for ops in groups.values()
+               if self.retries.get(ops[0]['seq'], (0, 0))[1] <= now]
+
+        if len(due) > 0:
+            pool = ThreadPool(processes=max(1, min(self.workers, len(due))))
+            try:
+                pool.map(self.drain, due)
+            finally:
+                pool.close()
+                pool.join()
+
+        with self.lock:
+            if len(self.pending) < 1 and self.done >= self.compact_after:
+                self.compact()
+            return len(self.pending)
+
+    def compact(self):
+        '''
+        Rewrite the journal with only the failed operations
+        (called with the lock held, when nothing is pending).
+        '''
+        temp = '{0}.tmp'.format(self.path)
+        with open(temp, 'w') as _journal:
+            for seq in sorted(self.failed.keys()):
+                _journal.write(json.dumps(self.failed[seq], sort_keys=True) +
+                               '\n')
+                _journal.write(json.dumps({'seq': seq, 'failed': True}) +
+                               '\n')
+            _journal.flush()
+            os.fsync(_journal.fileno())
+
+        self.journal.close()
+        os.rename(temp, self.path)
+        self.journal = open(self.path, 'a')
+        self.done = 0
+
+    def retry_failed(self):
+        '''
+        Queue the failed operations again.
+        '''
+        with self.lock:
+            for seq in sorted(self.failed.keys()):
+                record = self.failed.pop(seq)
+                self.seq += 1
+                record = {'seq': self.seq, 'op': record['op'],
+                          'args': record['args']}
+                self.append(record)
+                self.append({'seq': seq, 'done': True, 'result': None})
+                self.pending[self.seq] = record
+        self.wakeup.set()
+
+    def run(self):
+        '''
+        The flusher: wait for operations (or retries), then flush them.
+        '''
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def start(self):
+        '''
+        Start the background flusher.
+        '''
+        if self.flusher is None:
+            self.flusher = threading.Thread(target=self.run)
+            self.flusher.daemon = True
+            self.flusher.start()
+        return self
+
+    def close(self, timeout=None):
+        '''
+        Stop the background flusher, after trying to flush once more
+        (operations which are still pending stay in the journal).
+        '''
+        self.stopped.set()
+        self.wakeup.set()
+        if self.flusher is not None:
+            self.flusher.join(timeout)
+            self.flusher = None
+        self.flush()
+        self.journal.close()
+        self.locked.close()
@@ -0,0 +1,223 @@
+#! /usr/bin/env python2.7
+
+'''
+Stream (large) input, e.g.: the output of a command on stdin, into a Gist.
+The input is read incrementally and split into numbered part-files; every
+part is sent as soon as it is read, so memory use stays bounded by the size
+of a part, no matter how large the input is.
+Common arguments to all functions:
+    1. token: The access token for the API.
+    2. api: API URL for the endpoint, other than GitHub.
+'''
+
+import os
+import re
+import shutil
+from itertools import chain
+from datetime import datetime
+
+from gister import gists
+
+# Maximum size of a part (in bytes).
+PART_SIZE = 512 * 1024
+
+# Size of the reads from the input stream.
+BUFFER_SIZE = 64 * 1024
+
+# Parts after these many are pushed using git (in batches).
+API_PART_LIMIT = 20
+
+# Number of parts per push, with git.
+PUSH_PARTS = 16
+
+# Files of a Gist listed by the API, at most.
+API_FILE_LIMIT = 300
+
+
+def part_boundary(buffer, part_size):
+    '''
+    Find where to split a buffer: after the last newline within the part,
+    or before a (split) multi-byte UTF-8 character.
+    '''
+    cut = buffer.rfind(b'\n', 0, part_size) + 1
+    if cut > 0:
+        return cut
+
+    cut = part_size
+    while cut > part_size - 3 and (ord(buffer[cut:cut + 1]) & 0xC0) == 0x80:
+        cut -= 1
+    return cut
+
+
+def split_parts(stream, part_size=PART_SIZE, buffer_size=BUFFER_SIZE):
+    '''
+    Read a stream incrementally, yielding parts of at most 'part_size'.
+    '''
+    buffer = b''
+    eof = False
+
+    while True:
+        chunks, size = [buffer], len(buffer)
+        while not eof and size <= part_size:
+            chunk = stream.read(buffer_size)
+            if not chunk:
+                eof = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        buffer = b''.join(chunks)
+
+        if len(buffer) < 1:
+            return
+
+        cut = part_boundary(buffer, part_size) if len(buffer) > part_size \
+            else len(buffer)
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+
+def part_name(name, index):
+    '''
+    Name of a part-file, e.g.: build.log -> build.part0001.log
+    '''
+    root, ext = os.path.splitext(name)
+    return '{0}.part{1:04d}{2}'.format(root, index, ext)
+
+
+def last_part(name, files):
+    '''
+    Number of the last part-file of 'name' in the files of a Gist
+    (0 if there are none).
+    '''
+    root, ext = os.path.splitext(name)
+    pattern = re.compile(r'^{0}\.part(?P<index>\d{{4,}}){1}$'.format(
+        re.escape(root), re.escape(ext)))
+    indices = [int(_.group('index')) for _ in map(pattern.match, files)
+               if _ is not None]
+    return max(indices) if len(indices) > 0 else 0
+
+
+def as_text(part):
+    '''
+    Decode a part as UTF-8; returns None for binary content.
+    '''
+    if b'\0' in part:
+        return None
+    try:
+        return part.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def post_gist_stream(token, stream, name='stdin.txt', **kwargs):
+    '''
+    Post (or append to) a Gist from a stream, without reading it entirely.
+    If the input fits in a single part, it is posted as 'name', otherwise
+    as numbered part-files. Text parts are sent with the API; binary parts,
+    and the parts after 'api_parts' are pushed with git.
+    gist_id: Append the parts to this Gist, instead of creating a new one;
+             they are numbered after its existing part-files of 'name'
+             (and always written as part-files). If the Gist has more
+             files than the API lists, all the parts are pushed with git.
+    part_size: Maximum size of a part (in bytes).
+    api_parts: Number of parts sent with the API.
+    push_parts: Number of parts per push, with git.
+    description, public: Same as post_gist.
+
+    Caveats:
+        1. Returns the ID of the Gist, or None on failure (or empty input);
+           the parts sent before a failure are not rolled back.
+        2. Parts pushed with git are spooled to a temporary clone on disk.
+    '''
+    api = kwargs['api'] if 'api' in kwargs else None
+    gist_id = kwargs['gist_id'] if 'gist_id' in kwargs else None
+    public = kwargs['public'] if 'public' in kwargs else False
+    description = kwargs['description'] if 'description' in kwargs else None
+    part_size = kwargs['part_size'] if 'part_size' in kwargs else PART_SIZE
+    api_parts = kwargs['api_parts'] if 'api_parts' in kwargs \
+        else API_PART_LIMIT
+    push_parts = kwargs['push_parts'] if 'push_parts' in kwargs \
+        else PUSH_PARTS
+
+    parts = split_parts(stream, part_size=part_size)
+    first, second = next(parts, None), next(parts, None)
+    if first is None:
+        return None
+
+    parts = chain([first], [second] if second is not None else [], parts)
+
+    gist = gists.get_gist(token, gist_id, api=api) if gist_id else None
+    if gist is not None and 'id' not in gist:
+        return None
+
+    single = second is None and gist is None
+    gist_dir_path, pending, stub_name = None, 0, None
+
+    try:
+        # Appended parts are numbered after the existing ones; if the API
+        # doesn't list all of them, they are listed from a clone.
+        files = gist.get('files', {}) if gist is not None else {}
+        if gist is not None and (gist.get('truncated') or
+                                 len(files) >= API_FILE_LIMIT):
+            gist_dir_path = gists.clone_gist_git(
+                token, gist['git_pull_url'], api=api)
+            if gist_dir_path is None:
+                return None
+            files = os.listdir(gist_dir_path)
+        offset = last_part(name, files)
+
+        for index, part in enumerate(parts, 1):
+            filename = name if single else part_name(name, offset + index)
+            text = as_text(part)
+
+            if gist_dir_path is None and text is not None and \
+                    index <= api_parts:
+                files = {filename: {'content': text}}
+                if gist is None:
+                    gist = gists.post_gist(token, files, description,
+                                           public, api)
+                else:
+                    gist = gists.update_gist(token, gist['id'], files, None,
+                                             api=api)
+                if 'id' not in gist:
+                    return None
+                continue
+
+            if gist is None:
+                stub_name = '.gist-shell-stub-{0}'.format(
+                    datetime.utcnow().strftime('%s'))
+                stub = {stub_name: {'content': 'From gist-shell.\n'}}
+                gist = gists.post_gist(token, stub, description, public, api)
+                if 'id' not in gist:
+                    return None
+
+            if gist_dir_path is None:
+                gist_dir_path = gists.clone_gist_git(
+                    token, gist['git_pull_url'], api=api)
+                if gist_dir_path is None:
+                    return None
+                if stub_name is not None:
+                    os.remove(os.path.join(gist_dir_path, stub_name))
+
+            with open(os.path.join(gist_dir_path, filename), 'wb') as _part:
+                _part.write(part)
+            pending += 1
+
+            if pending >= push_parts:
+                if not gists.push_gist_git(token, gist_dir_path,
+                                           gist['git_push_url']):
+                    return None
+                pending = 0
+
+        if pending > 0 and not gists.push_gist_git(token, gist_dir_path,
+                                                   gist['git_push_url']):
+            return None
+
+    except (KeyError, TypeError, IOError, OSError):
+        return None
+
+    finally:
+        if gist_dir_path is not None:
+            shutil.rmtree(gist_dir_path, ignore_errors=True)
+
+    return gist['id']
@@ -0,0 +1,240 @@
+#! /usr/bin/env python2.7
+
+'''
+Synchronize a local directory with a Gist (rsync-style).
+Local files are hashed the way git hashes blobs, and compared with a cached
+manifest of the blob hashes on the Gist; only the changed files are sent.
+Common arguments to all functions:
+    1. token: The access token for the API.
+    2. api: API URL for the endpoint, other than GitHub.
+'''
+
+import os
+import re
+import json
+from hashlib import sha1
+from multiprocessing.pool import ThreadPool
+
+from gister import gists
+
+# Default path to store the manifests of the synchronized Gists.
+DEFAULT_MANIFEST_PATH = '/'.join([os.path.expanduser('~'),
+                                  '.gist-shell', 'manifests'])
+
+# Files larger than this (in bytes) are pushed using git, not the API.
+API_SIZE_LIMIT = 1024 * 1024
+
+# Size of the chunks read while hashing files.
+CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(path):
+    '''
+    Compute the git blob hash (SHA-1) of a file, without reading it
+    entirely into memory.
+    '''
+    hashed = sha1('blob {0}\0'.format(os.path.getsize(path)))
+    with open(path, 'rb') as _file:
+        for chunk in iter(lambda: _file.read(CHUNK_SIZE), b''):
+            hashed.update(chunk)
+    return hashed.hexdigest()
+
+
+def hash_dir(path, workers=4):
+    '''
+    Hash the (top-level, regular) files in a directory in parallel.
+    Gists are flat, so sub-directories and hidden files are ignored.
+    Returns a dictionary of {filename: blob-hash}.
+    '''
+    names = sorted([_ for _ in os.listdir(path) if not _.startswith('.') and
+                    os.path.isfile(os.path.join(path, _))])
+    paths = [os.path.join(path, _) for _ in names]
+
+    pool = ThreadPool(processes=max(1, workers))
+    try:
+        hashes = pool.map(hash_file, paths)
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict(zip(names, hashes))
+
+
+def parse_blob_hash(raw_url):
+    '''
+    Extract the blob hash from the 'raw_url' of a Gist file.
+    '''
+    blob = re.search(r'/raw/(?P<blob>[0-9a-f]{40})/', raw_url or '')
+    return blob.group('blob') if blob is not None else None
+
+
+def build_manifest(gist, etag=None):
+    '''
+    Build a manifest ({'etag': ..., 'files': {filename: blob-hash}, ...})
+    from the JSON of a Gist.
+    '''
+    files = {}
+    for name, item in gist.get('files', {}).items():
+        files[name] = parse_blob_hash(item.get('raw_url'))
+
+    return {
+        'etag': etag,
+        'files': files,
+        'git_pull_url': gist.get('git_pull_url'),
+        'git_push_url': gist.get('git_push_url'),
+    }
+
+
+def load_manifest(gist_id, path=DEFAULT_MANIFEST_PATH):
+    '''
+    Load the cached manifest of a Gist; returns None if it doesn't exist.
+    '''
+    manifest = os.path.join(path, '{0}.json'.format(gist_id))
+    if os.path.exists(manifest):
+        try:
+            return json.loads(open(manifest, 'r').read())
+        except (IOError, ValueError):
+            return None
+    return None
+
+
+def store_manifest(gist_id, manifest, path=DEFAULT_MANIFEST_PATH):
+    '''
+    Store the manifest of a Gist in the cache; returns False on failure.
+    '''
+    try:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        temp = os.path.join(path, '.{0}.json'.format(gist_id))
+        with open(temp, 'w') as _manifest_file:
+            _manifest_file.write(json.dumps(manifest, indent=4,
+                                            sort_keys=True))
+        os.rename(temp, os.path.join(path, '{0}.json'.format(gist_id)))
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def remote_manifest(token, gist_id, api=None, path=DEFAULT_MANIFEST_PATH):
+    '''
+    Fetch the manifest of a Gist, revalidating the cached copy with a
+    single conditional request. Returns None if the Gist can't be fetched.
+    '''
+    cached = load_manifest(gist_id, path=path)
+    etag = cached['etag'] if cached is not None else None
+
+    status, etag, gist = gists.fetch_gist(token, gist_id, etag=etag, api=api)
+
+    if status == 304 and cached is not None:
+        return cached
+
+    if gist is None:
+        return None
+
+    manifest = build_manifest(gist, etag=etag)
+    store_manifest(gist_id, manifest, path=path)
+    return manifest
+
+
+def is_text(path):
+    '''
+    Check if a file is small, plain-text (UTF-8) that the API can handle.
+    '''
+    if os.path.getsize(path) > API_SIZE_LIMIT:
+        return False
+    try:
+        content = open(path, 'rb').read()
+        content.decode('utf-8')
+    except (IOError, UnicodeDecodeError):
+        return False
+    return b'\0' not in content
+
+
+def plan_sync(local, remote):
+    '''
+    Compare the local and remote hashes; returns a tuple of
+    (files to upload, files to delete). Hidden files on the Gist
+    (e.g.: the stubs left by post_gist_git) are never deleted.
+    '''
+    upload = sorted([_ for _ in local if remote.get(_) != local[_]])
+    delete = sorted([_ for _ in remote if _ not in local and
+                     not _.startswith('.')])
+    return (upload, delete)
+
+
+def sync_gist(token, path, gist_id, **kwargs):
+    '''
+    Synchronize the files in the directory 'path' with a Gist.
+    Small text files are uploaded with the API (in a single PATCH), large
+    or binary files are pushed with git, and files on the Gist that
+    don't exist locally anymore are deleted.
+    workers: Number of threads used for hashing.
+    dry_run: Only compute (and return) the changes.
+    manifest_path: Directory to cache the manifests in.
+
+    Caveats:
+        1. An unchanged directory costs a single conditional request
+           (a '304 Not Modified' when the cached manifest is up-to-date);
+           a sync which changes the Gist re-fetches it once afterwards,
+           to cache the new ETag.
+        2. Returns a dictionary with the 'uploaded' and 'deleted' files,
+           or None if the Gist can't be fetched or the update fails.
+    '''
+    api = kwargs['api'] if 'api' in kwargs else None
+    workers = kwargs['workers'] if 'workers' in kwargs else 4
+    dry_run = kwargs['dry_run'] if 'dry_run' in kwargs else False
+    manifest_path = kwargs['manifest_path'] if 'manifest_path' in kwargs \
+        else DEFAULT_MANIFEST_PATH
+
+    local = hash_dir(path, workers=workers)
+    manifest = remote_manifest(token, gist_id, api=api, path=manifest_path)
+
+    if manifest is None:
+        return None
+
+    upload, delete = plan_sync(local, manifest['files'])
+    changes = {'uploaded': upload, 'deleted': delete}
+
+    if dry_run or (len(upload) < 1 and len(delete) < 1):
+        return changes
+
+    api_files, git_files = {}, {}
+    for name in upload:
+        file_path = os.path.join(path, name)
+        if is_text(file_path):
+            content = open(file_path, 'rb').read().decode('utf-8')
+            api_files.update({name: {'content': content}})
+        else:
+            git_files.update({name: {'path': file_path}})
+
+    for name in delete:
+        if len(git_files) > 0:
+            git_files.update({name: None})
+        else:
+            api_files.update({name: None})
+
+    if len(api_files) > 0:
+        response = gists.update_gist(token, gist_id, api_files, None, api=api)
+        if 'files' not in response:
+            return None
+
+    if len(git_files) > 0:
+        pushed = gists.update_gist_git(token, gist_id, git_files, api=api,
+                                       pull_url=manifest['git_pull_url'],
+                                       push_url=manifest['git_push_url'])
+        if not pushed:
+            return None
+
+    # Fetch the new ETag once, so that the next (unchanged) sync is a 304.
+    status, etag, gist = gists.fetch_gist(token, gist_id, api=api)
+    if gist is not None:
+        manifest = build_manifest(gist, etag=etag)
+    else:
+        manifest.update({'etag': None})
+        for name in upload:
+            manifest['files'].update({name: local[name]})
+        for name in delete:
+            manifest['files'].pop(name, None)
+    store_manifest(gist_id, manifest, path=manifest_path)
+
+    return changes
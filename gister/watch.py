@@ -0,0 +1,198 @@
+#! /usr/bin/env python2.7
+
+'''
+Watch Gists for changes (cheaply).
+Gists are polled with conditional requests (a '304 Not Modified' doesn't
+count against the rate limit), public Gists owned by the same user are
+checked with a single listing call ('since'), and the polling interval
+backs off when the rate limit runs low. Only the changes are reported, as
+events:
+    event = {
+        'id': 'aa5a315d61ae9438b18d',
+        'updated_at': '2010-04-14T02:15:15Z',
+        'deleted': False,
+        'files': {
+            'file1.txt': {
+                'status': 'added', 'modified' or 'removed',
+                'diff': 'unified diff of the contents'
+            },
+            ...
+        }
+    }
+'''
+
+import time
+import difflib
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from gister import gists
+
+
+def file_contents(gist):
+    '''
+    Return a dictionary of {filename: content} for a Gist.
+    '''
+    files = gist.get('files', {}) if gist is not None else {}
+    return dict([(name, item.get('content') or '')
+                 for name, item in files.items()])
+
+
+def diff_files(old, new):
+    '''
+    Compare two dictionaries of {filename: content}, and return the
+    per-file changes (with a unified diff).
+    '''
+    changes = {}
+    for name in sorted(set(old.keys()) | set(new.keys())):
+        before, after = old.get(name), new.get(name)
+        if before == after:
+            continue
+
+        if before is None:
+            status = 'added'
+        elif after is None:
+            status = 'removed'
+        else:
+            status = 'modified'
+
+        diff = difflib.unified_diff((before or '').splitlines(True),
+                                    (after or '').splitlines(True),
+                                    fromfile='a/{0}'.format(name),
+                                    tofile='b/{0}'.format(name))
+        changes[name] = {'status': status, 'diff': ''.join(diff)}
+
+    return changes
+
+
+def next_interval(rate, cost, interval, max_interval):
+    '''
+    Adapt the polling interval to the rate limit headroom; spend at most
+    half of the remaining requests (in the current window) on watching.
+    cost: Number of requests (counted against the rate limit) per cycle.
+    '''
+    remaining, reset = rate.get('remaining'), rate.get('reset')
+    if remaining is None or reset is None:
+        return interval
+
+    window = max(0, reset - time.time())
+    cost = max(1, cost)
+
+    if remaining <= cost:
+        return min(max_interval, max(interval, window))
+
+    return min(max_interval, max(interval, window * cost / (remaining / 2.0)))
+
+
+def watch_gists(token, gist_ids, **kwargs):
+    '''
+    Watch a set of Gists; a generator which yields the change events.
+    user: Public Gists owned by this user are checked with a single listing
+          call (it doesn't list secret Gists, which are always polled).
+    interval: Minimum polling interval (in seconds).
+    max_interval: Maximum polling interval (in seconds).
+    workers: Number of threads used for the conditional requests.
+    cycles: Stop after these many polling cycles (None to watch forever).
+    recheck: Poll the Gists checked with the listing call anyway, every
+             these many cycles, to notice deleted Gists.
+
+    Caveats:
+        1. The first cycle only records the state of the Gists.
+        2. Changes only to the description of a Gist are not reported.
+    '''
+    api = kwargs['api'] if 'api' in kwargs else None
+    user = kwargs['user'] if 'user' in kwargs else None
+    interval = kwargs['interval'] if 'interval' in kwargs else 60
+    max_interval = kwargs['max_interval'] if 'max_interval' in kwargs \
+        else 900
+    workers = kwargs['workers'] if 'workers' in kwargs else 8
+    cycles = kwargs['cycles'] if 'cycles' in kwargs else None
+    recheck = kwargs['recheck'] if 'recheck' in kwargs else 10
+
+    state = dict([(str(_), {'etag': None, 'files': {}, 'owner': None,
+                            'public': False, 'updated_at': None})
+                  for _ in gist_ids])
+    since = None
+    current = 0
+    pool = ThreadPool(processes=max(1, workers))
+
+    def _poll(gist_id):
+        etag = state[gist_id]['etag']
+        try:
+            return (gist_id,) + gists.fetch_gist(token, gist_id, etag=etag,
+                                                 api=api)
+        except requests.exceptions.RequestException:
+            return (gist_id, None, etag, None)
+
+    try:
+        while cycles is None or current < cycles:
+            cost = 0
+            poll = set(state.keys())
+
+            coalesced = set([_ for _ in state if user is not None and
+                             state[_]['public'] and
+                             state[_]['owner'] == user.lower()])
+            if len(coalesced) > 0:
+                # Anything updated after the first fetch will be listed.
+                if since is None:
+                    since = min([state[_]['updated_at'] for _ in coalesced])
+
+                try:
+                    _, listing = gists.fetch_gist_list(
+                        token, user, since=since, fields=['id', 'updated_at'],
+                        page_limit=None, api=api)
+                except requests.exceptions.RequestException:
+                    listing = None
+                cost += 1
+
+                # Deleted Gists are never listed, so every 'recheck' cycles
+                # (or if the listing fails) all of them are polled (free).
+                if listing is not None and current % recheck != 0:
+                    updated = set([_.id for _ in listing])
+                    poll = (poll - coalesced) | (coalesced & updated)
+                if listing is not None:
+                    since = max([since] + [_.updated_at for _ in listing
+                                           if _.updated_at is not None])
+
+            for gist_id, status, etag, gist in pool.map(_poll, sorted(poll)):
+                if status == 304:
+                    continue
+                cost += 1
+
+                if status == 404:
+                    del state[gist_id]
+                    yield {'id': gist_id, 'updated_at': None,
+                           'deleted': True, 'files': {}}
+                    continue
+
+                if gist is None:
+                    continue
+
+                owner = (gist.get('owner') or {}).get('login')
+                updated_at = gist.get('updated_at')
+                files = file_contents(gist)
+                changes = diff_files(state[gist_id]['files'], files)
+                state[gist_id].update({
+                    'etag': etag, 'files': files, 'updated_at': updated_at,
+                    'owner': owner.lower() if owner is not None else None,
+                    'public': bool(gist.get('public'))
+                })
+
+                if current > 0 and len(changes) > 0:
+                    yield {'id': gist_id, 'updated_at': updated_at,
+                           'deleted': False, 'files': changes}
+
+            current += 1
+            if len(state) < 1 or (cycles is not None and current >= cycles):
+                break
+
+            try:
+                rate = gists.get_rate_limit(token, api=api)
+            except requests.exceptions.RequestException:
+                rate = {}
+            time.sleep(next_interval(rate, cost, interval, max_interval))
+
+    finally:
+        pool.close()
+        pool.join()